@@ -14,13 +14,24 @@ Last Change 31.03.2023
 
 import pandas as pd
 import spotipy
-from spotipy.oauth2 import SpotifyOAuth
+from spotipy.oauth2 import SpotifyOAuth, SpotifyClientCredentials
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
 import os
 from datetime import datetime
 import time
+import shelve
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import configparser
+import json
+from collections import Counter
+from dataclasses import dataclass, field
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
+import queue
+import atexit
 import sys
 
 # Logging
@@ -33,17 +44,108 @@ logfilehandler = TimedRotatingFileHandler(
     encoding='latin1',
     delay=False)
 
+# The handlers write on a background thread, logging calls only put the records in a queue
+logqueue = queue.Queue(-1)
+loglistener = QueueListener(
+    logqueue,
+    logfilehandler,
+    logging.StreamHandler(sys.stdout))
+loglistener.start()
+# Flush the queued records on every exit, also when the script fails during startup
+atexit.register(loglistener.stop)
+
 logging.basicConfig(
     level=logging.INFO, # Loglevels to choose from: DEBUG, INFO, WARNING, ERROR, CRITICAL
     handlers=[
-        logfilehandler,
-        logging.StreamHandler(sys.stdout)],
+        QueueHandler(logqueue)],
     format='%(asctime)s %(message)s',
         )
 
 
+# Settings
+
+API_WORKERS = 10 # Number of Spotify API requests running in parallel
+SEARCH_RATE = 10 # Maximum number of Spotify searches per second
+TRACK_CACHE = './track_cache' # Path to the cache of already resolved Track IDs
+NEGATIVE_CACHE_TTL = 86400 # Seconds until a track that was not found is searched again
+API_BATCH_SIZE = 100 # Maximum number of tracks the Spotify API accepts per playlist request
+RATE_LIMIT_RETRIES = 5 # How often a request is repeated after Spotify answered with 429 Too Many Requests
+CSV_SETTLE_TIME = 2 # Seconds the csv must stay unchanged before it is read
+STATE_FILE = './state.json' # Path to the file that remembers which rows of the csv were already processed
+
+
 # Modules
 
+@dataclass(slots=True, frozen=True)
+class SpotifyConfig:
+    '''
+    Values of the config file, all values are strings
+    '''
+
+    username: str # the spotify username
+    sci: str # spotify client ID
+    scs: str = field(repr=False) # spotify client Secret, kept out of the logs
+    uri: str # spotify return URI necessary for SpotifyOAuth
+    playlist_id: str # ID of the playlist to update
+    market: str | None # optional ISO 3166-1 alpha-2 country code of the user, None searches all markets
+    csv: str # Full path to the input csv
+
+
+class RateLimiter:
+    '''
+    Leaky bucket that spaces out API calls shared between several threads
+
+    Parameters:
+	__________
+    rate: maximum number of calls per second
+    '''
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_call = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        '''
+        Blocks until the next call is allowed
+        '''
+
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def with_retry(function):
+    '''
+    Decorator that repeats a Spotify API call when it was rejected with 429 Too Many Requests,
+    waiting as many seconds as Spotify asks for in the Retry-After header
+
+    Parameters:
+	__________
+    function: function calling the Spotify API
+
+    Returns:
+    The wrapped function
+    '''
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                return function(*args, **kwargs)
+            except spotipy.SpotifyException as err:
+                if err.http_status != 429 or attempt == RATE_LIMIT_RETRIES:
+                    raise
+                retry_after = int((err.headers or {}).get('Retry-After', 1))
+                logging.warning('%s: Rate limited, retrying in %s seconds', function.__name__, retry_after)
+                time.sleep(retry_after)
+
+    return wrapper
+
+
 def read_config(path_to_file):
     ''' 
     Reads the configuration file
@@ -53,8 +155,8 @@ def read_config(path_to_file):
     Full path to file as a string
 
     Returns:
-    All Variables deffined in the config file
-    All fields in the config file must be filled
+    A SpotifyConfig with all Variables deffined in the config file
+    All fields in the config file must be filled, except market which is optional
     All variables are returned as strings even if it is a numerical value
     '''
     
@@ -64,21 +166,23 @@ def read_config(path_to_file):
             config = configparser.ConfigParser()
             config.read(path_to_file)
 
-            username = config['Spotify']['username']
-            sci = config['Spotify']['sci']
-            scs = config['Spotify']['scs']
-            uri = config['Spotify']['uri']
-            playlist_id = config['Spotify']['playlist_id']
-            csv = config['File']['csv']
+            spotify_config = SpotifyConfig(
+                username=config['Spotify']['username'],
+                sci=config['Spotify']['sci'],
+                scs=config['Spotify']['scs'],
+                uri=config['Spotify']['uri'],
+                playlist_id=config['Spotify']['playlist_id'],
+                market=config['Spotify'].get('market') or None,
+                csv=config['File']['csv'])
 
         except FileNotFoundError as err:
-            logging.ERROR(err)
+            logging.error(err)
             time.sleep(15)
     else:
         raise TypeError('path to file must be of type string')
 
-    logging.debug(username, sci, scs, uri, playlist_id, csv)
-    return username, sci, scs, uri, playlist_id, csv
+    logging.debug(spotify_config)
+    return spotify_config
 
 
 def check_csv(path_to_file):
@@ -94,12 +198,13 @@ def check_csv(path_to_file):
     '''
     
     if type(path_to_file) == str: 
-        logging.debug('{}: Checking {} for changes'.format(check_csv.__name__, path_to_file))
+        logging.debug('%s: Checking %s for changes', check_csv.__name__, path_to_file)
     else:
         raise TypeError('path to file must be of type string')
 
-    logging.debug('Last change: {}'.format(datetime.fromtimestamp(os.path.getmtime(path_to_file))))
-    return os.path.getmtime(path_to_file)
+    stat = os.stat(path_to_file)
+    logging.debug('Last change: %s', datetime.fromtimestamp(stat.st_mtime))
+    return stat.st_mtime
 
 
 def read_dbc_export(path_to_file) -> str:
@@ -115,160 +220,378 @@ def read_dbc_export(path_to_file) -> str:
     '''
    
     if type(path_to_file) == str: 
-        logging.info('{}: Reading input csv'.format(read_dbc_export.__name__))
-        data = pd.read_csv(path_to_file, delimiter=';', header=None, encoding='latin1')
-        data.columns = ['artist', 'title']
-        logging.debug('{}: Data \n {}'.format(read_dbc_export.__name__, data))
+        logging.info('%s: Reading input csv', read_dbc_export.__name__)
+        try:
+            # The pyarrow engine parses multithreaded and is a lot faster than the default engine
+            data = pd.read_csv(path_to_file, delimiter=';', header=None, names=['artist', 'title'], encoding='latin1', engine='pyarrow')
+        except ImportError:
+            data = pd.read_csv(path_to_file, delimiter=';', header=None, names=['artist', 'title'], encoding='latin1')
+        # Build the Spotify search query for all tracks at once
+        data['q'] = data['artist'].astype(str).str.strip() + ' ' + data['title'].astype(str).str.strip()
+        logging.debug('%s: Data \n %s', read_dbc_export.__name__, data)
     else:
         raise TypeError('path to file must be of type string')
     return data
 
 
-def add_track_to_playlist(username, sci, scs, uri, playlist_id, songs_played) -> None:
+@with_retry
+def search_track(sp, q, limiter, market):
+    '''
+    Searches the Spotify Track ID for an Artist - Title combination
+
+    Parameters:
+	__________
+    sp: spotipy client
+    q: the search query containing artist and title
+    limiter: RateLimiter shared by all searches
+    market: country code, only tracks playable in this market are returned, None for no filter
+
+    Returns:
+    The Spotify Track ID or None if no track was found
+    '''
+
+    limiter.wait()
+    # Search the Track ID on Spotify and limit the results to 1
+    result = sp.search(q=q, type='track', limit=1, market=market)
+    try:
+        track_id = result['tracks']['items'][0]['id']
+    except IndexError:
+        logging.warning('No track found for %s', q)
+        return None
+
+    logging.info('Found Track ID %s for %s', track_id, q)
+    return track_id
+
+
+def add_track_to_playlist(sp, sp_search, config, songs_played, cache, existing_ids) -> None:
     '''
     Takes two Strings (Artist, Title) and searches the Spotify Track ID via the Spotify API.
     Then Adds those Track IDs to a Spotify Playlist at the beginning of the playlist
     
     Parameters:
 	__________
-    username: the spotify username
-    sci: spotify client ID
-    scs: spotify client Secret
-    uir: spotify return URI necessary for SpotifyOAuth
-    playlist_id: ID of the playlist to update (can be found in the browser URL when the Playlist is open)
+    sp: spotipy client with user authorization, used to modify the playlist
+    sp_search: spotipy client with client credentials, used for the searches
+    config: SpotifyConfig, config.playlist_id is the playlist to update
     songs_played: a Pandas Dataframe contaning a series of Artist - Title combinations to add
+    cache: shelve with the Track IDs resolved in previous runs, the lower case query is used as key
+    existing_ids: set of the Track IDs already in the playlist, these are not added again
     
     Returns:
     Nothing
     '''
     
-    logging.info('{}: Starting playlist update'.format(add_track_to_playlist.__name__))
-    logging.debug('Updating Playlist with these parameters {}, {}, {}, {}'.format(username, sci, playlist_id, uri))
-    
-    scope = 'playlist-modify-public' # TODO Change to 'playlist-modify-public' for production
-    playlist = []
+    logging.info('%s: Starting playlist update', add_track_to_playlist.__name__)
+    logging.debug('Updating Playlist %s', config.playlist_id)
+
+    # The Spotify search is not case sensitive, so the lower case query identifies a track
+    keys = songs_played['q'].str.lower().values
+    # Tracks that were played several times only need to be resolved once
+    queries = dict(zip(keys, songs_played['q'].values))
+
+    # Look up the tracks that were already resolved in previous runs
+    track_ids = {}
+    for key in queries:
+        if key in cache:
+            track_id, expires = cache[key]
+            if expires is None or expires > time.time():
+                track_ids[key] = track_id
+    missing = [key for key in queries if key not in track_ids]
+    logging.info('%s of %s tracks found in cache', len(queries) - len(missing), len(queries))
+
+    # Search Spotify for the remaining tracks in parallel
+    limiter = RateLimiter(SEARCH_RATE)
+    with ThreadPoolExecutor(max_workers=API_WORKERS) as pool:
+        results = pool.map(lambda key: search_track(sp_search, queries[key], limiter, config.market), missing)
+        for key, track_id in zip(missing, results):
+            track_ids[key] = track_id
+            # Tracks that were not found are only cached for a while, they might get released later
+            cache[key] = (track_id, None if track_id else time.time() + NEGATIVE_CACHE_TTL)
+    cache.sync()
+
+    # Keep the order of the df and skip tracks that are already in the playlist
+    playlist = [track_ids[key] for key in keys if track_ids[key] and track_ids[key] not in existing_ids]
+    logging.info('%s of %s tracks are not in the playlist yet', len(playlist), len(keys))
+    if not playlist:
+        return
 
-    # Get connection to Spotify
-    sp = spotipy.Spotify(auth_manager=SpotifyOAuth(username=username, client_id=sci,scope=scope ,client_secret=scs ,redirect_uri=uri))
+    # Add tracks to palylist in batches, the last batch is added first so the order of the csv
+    # is kept at the beginning of the playlist
+    batches = [playlist[i:i + API_BATCH_SIZE] for i in range(0, len(playlist), API_BATCH_SIZE)]
+    for batch in reversed(batches):
+        with_retry(sp.playlist_add_items)(config.playlist_id, batch, position=0)
+    logging.info('Playlist update succesfull')
 
-    # Search  Spotify and get the track IDs
-    for index, row in songs_played.iterrows():
 
-        # Loop through the pandas df and extrackt artist and track
-        artist, title = row['artist'], row['title'] 
-        # Search the Track ID on Spotify and limit the results to 1
-        result = sp.search(q='{}+{}'.format(artist, title), type='track', limit=1)
-        # Add the track ID to the playlist list for later use
-        try:
-            playlist.append(result['tracks']['items'][0]['id'])
-        except IndexError as err:
-            logging.warning('Appanding list did not work with {}'.format())
-            logging.error(err)
+def fetch_playlist_tracks(sp, playlist_id):
+    '''
+    Gets the ID and URI of all tracks in a Spotify playlist, the pages of the playlist are requested in parallel
 
-        logging.info('Found Track ID {} for {} - {}'.format(result['tracks']['items'][0]['id'], artist, title))
-        
-    # This is neccasary for some reason it won't work when directly inputing the username
-    user_id = sp.me()['id']
-    
-    # Add tracks to palylist
-    try:
-        sp.user_playlist_add_tracks(user_id, playlist_id, playlist, position=0)
-        logging.info('Playlist update succesfull')
-    except err:
-        logging.warning(err)    
+    Parameters:
+	__________
+    sp: spotipy client
+    playlist_id: ID of the playlist (can be found in the browser URL when the Playlist is open)
+
+    Returns:
+    A list with a dict containing 'id' and 'uri' per track in playlist order,
+    None for unavailable or removed tracks so the positions still match the playlist
+    '''
 
+    # Only request the fields that are needed to keep the responses small
+    fields = 'items(track(id,uri)),total'
+    first_page = with_retry(sp.playlist_items)(playlist_id, fields=fields, limit=API_BATCH_SIZE)
+    offsets = range(API_BATCH_SIZE, first_page['total'], API_BATCH_SIZE)
 
-def remove_track_from_playlist(username, sci, scs, uri, playlist_id) -> None:
+    with ThreadPoolExecutor(max_workers=API_WORKERS) as pool:
+        pages = pool.map(lambda offset: with_retry(sp.playlist_items)(playlist_id, fields=fields, limit=API_BATCH_SIZE, offset=offset), offsets)
+        items = first_page['items'] + [item for page in pages for item in page['items']]
+
+    return [item['track'] for item in items]
+
+
+def remove_track_from_playlist(sp, config):
     '''
     Removes the last Track of the a given Sotify playist
 
     Parameters:
 	__________
-    username: the spotify username
-    sci: spotify client ID
-    scs: spotify client Secret
-    uir: spotify return URI necessary for SpotifyOAuth
-    playlist_id: ID of the playlist to update (can be found in the browser URL when the Playlist is open)
+    sp: spotipy client
+    config: SpotifyConfig, config.playlist_id is the playlist to update
     
     Returns:
-    None
+    A set with the Track IDs that are left in the playlist
     '''
 
-    logging.info('{}: Removing tracks from Playlist'.format(remove_track_from_playlist.__name__))
-    logging.debug('Removing Tracks with these parameters {}, {}, {}'.format(username, sci, playlist_id))
-    
-    scope = 'playlist-modify-public' # TODO Change to 'playlist-modify-public' for production
+    logging.info('%s: Removing tracks from Playlist', remove_track_from_playlist.__name__)
+    logging.debug('Removing Tracks from Playlist %s', config.playlist_id)
 
-    # Get connection to Spotify
-    sp = spotipy.Spotify(auth_manager=SpotifyOAuth(username=username, client_id=sci,scope=scope ,client_secret=scs ,redirect_uri=uri))
+    # Remember the playlist version the positions below refer to
+    snapshot_id = with_retry(sp.playlist)(config.playlist_id, fields='snapshot_id')['snapshot_id']
 
     # Get all playlist tracks
-    playlist_tracks = []
-    results = sp.user_playlist_tracks(username,playlist_id)
-    playlist_tracks = results['items']
-    while results['next']:
-        results = sp.next(results)
-        playlist_tracks.extend(results['items'])
+    playlist_tracks = fetch_playlist_tracks(sp, config.playlist_id)
 
     # Get number of songs in playlist
     num_tracks = len(playlist_tracks)
-    logging.info('{} tracks are in the playlist'.format(num_tracks))
+    logging.info('%s tracks are in the playlist', num_tracks)
     
+    # Get IDs of the last 100 Songs, these stay in the playlist
+    kept_ids = {track['id'] for track in playlist_tracks[:100] if track}
+
     # Do nothing if playlist is less then 100 songs long
     if num_tracks <= 100:
+        return kept_ids
+
+    # Positions of all tracks besides the last 100, starting with the oldest so the positions
+    # of the remaining tracks don't shift between the batches
+    positions = list(range(num_tracks - 1, 99, -1))
+
+    # Delete the tracks at these positions in batches
+    for i in range(0, len(positions), API_BATCH_SIZE):
+        items = {}
+        for position in positions[i:i + API_BATCH_SIZE]:
+            # Unavailable tracks have no URI and can't be removed
+            if playlist_tracks[position]:
+                items.setdefault(playlist_tracks[position]['uri'], []).append(position)
+        if not items:
+            continue
+        logging.info('%s: Removing tracks %s', remove_track_from_playlist.__name__, list(items))
+        items = [{'uri': uri, 'positions': track_positions} for uri, track_positions in items.items()]
+        result = with_retry(sp.playlist_remove_specific_occurrences_of_items)(config.playlist_id, items, snapshot_id=snapshot_id)
+        snapshot_id = result['snapshot_id']
+
+    return kept_ids
+
+
+def read_state(path_to_file):
+    '''
+    Reads the rows of the csv that were already added to the playlist
+
+    Parameters:
+	__________
+    path_to_file: Full path to the state file as a string
+
+    Returns:
+    A list with the lower case search query of every processed row, empty if there is no state file yet
+    '''
+
+    try:
+        with open(path_to_file) as file:
+            return json.load(file)['rows']
+    except FileNotFoundError:
+        return []
+    except (json.JSONDecodeError, KeyError, TypeError) as err:
+        logging.warning('%s: Cannot use state file %s, processing the whole csv \n%s', read_state.__name__, path_to_file, err)
+        return []
+
+
+def write_state(path_to_file, rows) -> None:
+    '''
+    Stores the rows of the csv that were already added to the playlist
+
+    Parameters:
+	__________
+    path_to_file: Full path to the state file as a string
+    rows: list with the lower case search query of every processed row
+
+    Returns:
+    None
+    '''
+
+    # Write to a temporary file first so a crash can't leave a truncated state file behind
+    temp_file = path_to_file + '.tmp'
+    with open(temp_file, 'w') as file:
+        json.dump({'rows': rows}, file)
+    os.replace(temp_file, path_to_file)
+
+
+def update_playlist(sp, sp_search, config) -> None:
+    '''
+    Reads the input csv and updates the playlist with the tracks that were played
+
+    Parameters:
+	__________
+    sp: spotipy client with user authorization
+    sp_search: spotipy client with client credentials for the searches
+    config: SpotifyConfig with the values from the config file
+
+    Returns:
+    None
+    '''
+
+    # Read in the file with the broadcasted playlist
+    # An empty or half written csv can't be parsed (pandas and pyarrow raise a ValueError)
+    try:
+        songs_played = read_dbc_export(config.csv)
+    except (OSError, ValueError) as err:
+        logging.warning('Cannot read file \n%s', err)
         return
 
-    # Get IDs of the last 100 Songs
-    last_100_track_ids = []
-    for i in range(100):
-        last_100_track_ids.append(playlist_tracks[i]['track']['id'])
+    # Rows that were already in the csv at the last update are processed, no matter where they moved to.
+    # They are counted so a track that shows up more often than before is still new
+    rows = list(songs_played['q'].str.lower().values)
+    processed = Counter(read_state(STATE_FILE))
+    is_new = []
+    for row in rows:
+        is_new.append(processed[row] <= 0)
+        processed[row] -= 1
+    new_songs = songs_played[is_new]
+    logging.info('%s: %s new tracks in the csv', update_playlist.__name__, len(new_songs))
+    if new_songs.empty:
+        return
 
-    # Delete all tracks besides the last 100
-    for i in range(num_tracks - 101, -1, -1):
-        if playlist_tracks[i]['track']['id'] not in last_100_track_ids:
-            logging.info('{}: Removing tracks with Track ID {}'.format(remove_track_from_playlist.__name__, playlist_tracks[i]['track']['id']))
-            sp.playlist_remove_all_occurrences_of_items(playlist_id, [playlist_tracks[i]['track']['id']])
+    # Remove the last song from the playlist to make space
+    existing_ids = set()
+    try:
+        existing_ids = remove_track_from_playlist(sp, config)
+    except Exception as err:
+        logging.warning(err)     
 
+    # Add all new tracks that were played and are not in the playlist yet.
+    # The cache is opened here because updates run on the watchdog thread and
+    # some dbm backends (dbm.sqlite3) only allow access from the opening thread
+    try:
+        with shelve.open(TRACK_CACHE) as cache:
+            add_track_to_playlist(sp, sp_search, config, new_songs, cache, existing_ids)
+        write_state(STATE_FILE, rows)
+    except Exception as err:
+        logging.warning(err)            
 
-def main():
 
-    logging.info('Script startet')
+class CsvChangeHandler(FileSystemEventHandler):
+    '''
+    Watchdog event handler that calls update whenever the input csv has been changed
 
-    # Declare Variables
-    username, sci, scs, uri, playlist_id, csv = read_config('./config.ini')
-    
-    while True:
-        
-        last_time_modified = check_csv(csv)
-        time.sleep(1)
+    Parameters:
+	__________
+    csv: Full path to the input csv as a string
+    update: function without arguments that updates the playlist
+    '''
 
-        # Check if the input csv has been changed
-        if last_time_modified != check_csv(csv):
+    def __init__(self, csv, update):
+        self.csv = os.path.abspath(csv)
+        self.update = update
+        self.last_time_modified = check_csv(self.csv)
 
-            logging.info('{}: {} has been changed.'.format(main.__name__, csv))
+    def on_modified(self, event):
+        self.check(event.src_path)
 
-            # Read in the file with the broadcasted playlist
-            try:
-                songs_played = read_dbc_export(csv)
-            except PermissionError as err:
-                logging.warning('Cannot open file \n{}'.format(err))
+    def on_created(self, event):
+        self.check(event.src_path)
 
-            # Remove the last song from the playlist to make space
-            try:
-                remove_track_from_playlist(username, sci, scs, uri, playlist_id)
-            except Exception as err:
-                logging.warning(err)     
+    def on_moved(self, event):
+        self.check(event.dest_path)
 
-            # Add all tracks that were played to the playlist
-            try:
-                add_track_to_playlist(username, sci, scs, uri, playlist_id, songs_played)
-            except Exception as err:
-                logging.warning(err)            
+    def check(self, path):
+        '''
+        Updates the playlist if path is the input csv and its modification time changed
+        '''
 
-        else:
-            continue
+        if os.path.abspath(path) != self.csv:
+            return
+
+        # Errors must not reach watchdog, they would stop the observer thread and end the script
+        try:
+            # Writing a file can cause several events, only react once per change
+            time_modified = check_csv(self.csv)
+            if time_modified == self.last_time_modified:
+                return
+
+            # The first event arrives while the csv is still written, wait until it stays unchanged
+            while True:
+                time.sleep(CSV_SETTLE_TIME)
+                settled_time_modified = check_csv(self.csv)
+                if settled_time_modified == time_modified:
+                    break
+                time_modified = settled_time_modified
+            self.last_time_modified = time_modified
+
+            logging.info('%s: %s has been changed.', type(self).__name__, self.csv)
+            self.update()
+        except Exception:
+            logging.exception('%s: Updating the playlist failed', type(self).__name__)
+
+
+def main():
+
+    logging.info('Script startet')
+
+    # Declare Variables
+    config = read_config('./config.ini')
+
+    scope = 'playlist-modify-public' # TODO Change to 'playlist-modify-public' for production
+
+    # Get connection to Spotify, the client is reused for all updates to keep the connection and token alive.
+    # 429 is not retried by the clients, with_retry handles it with the Retry-After header of the response
+    sp = spotipy.Spotify(
+        auth_manager=SpotifyOAuth(username=config.username, client_id=config.sci, scope=scope, client_secret=config.scs, redirect_uri=config.uri),
+        retries=10,
+        status_retries=10,
+        status_forcelist=(500, 502, 503, 504),
+        backoff_factor=0.3)
+
+    # Searches don't need user authorization, the client credentials flow needs no redirect and no user token.
+    # Without a user token Spotify doesn't know the country, so the searches pass config.market if it is set
+    sp_search = spotipy.Spotify(
+        auth_manager=SpotifyClientCredentials(client_id=config.sci, client_secret=config.scs),
+        retries=10,
+        status_retries=10,
+        status_forcelist=(500, 502, 503, 504),
+        backoff_factor=0.3)
+
+    # Watch the folder of the input csv and update the playlist whenever the csv changes
+    handler = CsvChangeHandler(config.csv, lambda: update_playlist(sp, sp_search, config))
+    observer = Observer()
+    observer.schedule(handler, os.path.dirname(handler.csv), recursive=False)
+    observer.start()
+
+    try:
+        while observer.is_alive():
+            observer.join(1)
+    finally:
+        observer.stop()
+        observer.join()
             
             
 if __name__ == "__main__":
     main()
-   